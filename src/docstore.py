@@ -0,0 +1,175 @@
+import os
+import json
+import mmap
+import zlib
+import logging
+from functools import lru_cache
+import numpy as np
+
+# Number of documents compressed together; larger blocks compress better but make random access slower
+DOCSTORE_BLOCK_SIZE = int(os.environ.get("DOCSTORE_BLOCK_SIZE", "64"))
+
+MANIFEST_FILE = "manifest.json"
+TEXTS_FILE = "texts.bin"
+IDS_FILE = "ids.npy"
+OFFSETS_FILE = "offsets.npy"
+BLOCK_OFFSETS_FILE = "block_offsets.npy"
+
+
+def build_document_store(store_path, ids, texts, compress=False, block_size=DOCSTORE_BLOCK_SIZE):
+    """
+    Write recipe texts into a compact document store.
+
+    All texts are concatenated into one buffer (optionally zlib compressed in blocks of
+    block_size documents) next to an array of offsets, so a single document can be
+    sliced out without reading the others.
+
+    Args:
+        store_path (str): Directory to write the store to
+        ids (list): Numeric document ids, as used in the vector store
+        texts (list): The document texts, in the same order as ids
+        compress (bool): Whether to compress the texts in blocks
+        block_size (int): Documents per compressed block
+    """
+    os.makedirs(store_path, exist_ok=True)
+
+    ids = np.asarray([int(doc_id) for doc_id in ids], dtype=np.int64)
+    order = np.argsort(ids, kind="stable")
+    ids = ids[order]
+    encoded = [texts[i].encode("utf-8") for i in order]
+
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(text) for text in encoded])
+
+    block_offsets = [0]
+    with open(os.path.join(store_path, TEXTS_FILE), "wb") as f:
+        if compress:
+            for start in range(0, len(encoded), block_size):
+                block = zlib.compress(b"".join(encoded[start:start + block_size]), 6)
+                f.write(block)
+                block_offsets.append(block_offsets[-1] + len(block))
+        else:
+            for text in encoded:
+                f.write(text)
+
+    np.save(os.path.join(store_path, IDS_FILE), ids)
+    np.save(os.path.join(store_path, OFFSETS_FILE), offsets)
+    np.save(os.path.join(store_path, BLOCK_OFFSETS_FILE), np.asarray(block_offsets, dtype=np.int64))
+    with open(os.path.join(store_path, MANIFEST_FILE), "w") as f:
+        json.dump({"count": len(encoded), "compressed": compress, "block_size": block_size}, f)
+
+    logging.info(f"Document store with {len(encoded)} documents written to {store_path}")
+
+
+class DocumentStore:
+    """
+    Read-only, memory-mapped access to the texts written by build_document_store.
+    """
+
+    def __init__(self, store_path):
+        with open(os.path.join(store_path, MANIFEST_FILE), "r") as f:
+            manifest = json.load(f)
+
+        self.compressed = manifest["compressed"]
+        self.block_size = manifest["block_size"]
+        self.ids = np.load(os.path.join(store_path, IDS_FILE), mmap_mode="r")
+        self.offsets = np.load(os.path.join(store_path, OFFSETS_FILE), mmap_mode="r")
+        self.block_offsets = np.load(os.path.join(store_path, BLOCK_OFFSETS_FILE), mmap_mode="r")
+
+        self._file = open(os.path.join(store_path, TEXTS_FILE), "rb")
+        if os.fstat(self._file.fileno()).st_size:
+            self._buffer = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        else:
+            self._buffer = b""
+
+        # Cache recently decompressed blocks, the instance lives as long as the process
+        self._block = lru_cache(maxsize=128)(self._read_block)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, doc_id):
+        return self._position(doc_id) is not None
+
+    def get(self, doc_id):
+        """
+        Return the full text of a document.
+
+        Args:
+            doc_id (str): The document id
+
+        Returns:
+            str: The text, or None if the id is unknown
+        """
+        position = self._position(doc_id)
+        if position is None:
+            return None
+        return self._slice(position, int(self.offsets[position + 1] - self.offsets[position])).decode("utf-8")
+
+    def preview(self, doc_id, max_chars=500):
+        """
+        Return the beginning of a document without decoding all of it.
+
+        Args:
+            doc_id (str): The document id
+            max_chars (int): Maximum number of characters before the text is cut off
+
+        Returns:
+            str: The preview, ending in "..." if the text was cut off, or None if the id is unknown
+        """
+        position = self._position(doc_id)
+        if position is None:
+            return None
+
+        total = int(self.offsets[position + 1] - self.offsets[position])
+        # A utf-8 character takes at most 4 bytes
+        length = min(total, max_chars * 4 + 4)
+        text = self._slice(position, length).decode("utf-8", errors="ignore")
+        if len(text) > max_chars or length < total:
+            return text[:max_chars] + "..."
+        return text
+
+    def _position(self, doc_id):
+        try:
+            key = int(doc_id)
+        except (TypeError, ValueError):
+            return None
+        position = int(np.searchsorted(self.ids, key))
+        if position < len(self.ids) and self.ids[position] == key:
+            return position
+        return None
+
+    def _slice(self, position, length):
+        start = int(self.offsets[position])
+        if not self.compressed:
+            return self._buffer[start:start + length]
+
+        block = position // self.block_size
+        block_start = int(self.offsets[block * self.block_size])
+        start -= block_start
+        return self._block(block)[start:start + length]
+
+    def _read_block(self, block):
+        return zlib.decompress(self._buffer[int(self.block_offsets[block]):int(self.block_offsets[block + 1])])
+
+
+def load_document_store(store_path):
+    """
+    Open the document store if it has been built.
+
+    Args:
+        store_path (str): Directory of the store
+
+    Returns:
+        DocumentStore: The store, or None if it doesn't exist
+    """
+    if not os.path.exists(os.path.join(store_path, MANIFEST_FILE)):
+        logging.info("No document store found, reading documents from the vector store")
+        return None
+    try:
+        store = DocumentStore(store_path)
+        logging.info(f"Opened document store with {len(store)} documents")
+        return store
+    except Exception as e:
+        logging.error(f"Error opening document store: {str(e)}")
+        return None
@@ -0,0 +1,96 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+from langchain_core.embeddings import Embeddings
+
+# How long to wait for more queries before sending a batch, and the largest batch to send
+EMBED_BATCH_WINDOW_MS = float(os.environ.get("EMBED_BATCH_WINDOW_MS", "5"))
+EMBED_MAX_BATCH_SIZE = int(os.environ.get("EMBED_MAX_BATCH_SIZE", "32"))
+# How long a caller waits for its query embedding before giving up
+EMBED_QUERY_TIMEOUT = float(os.environ.get("EMBED_QUERY_TIMEOUT", "60"))
+
+
+class MicroBatchEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that merges query embeddings from concurrent requests.
+
+    Every embed_query call is queued; a background thread collects queries for up to
+    window_ms milliseconds or max_batch_size queries, embeds them with one
+    embed_documents call and hands each caller its vector through a future.
+    embed_documents calls are already batched and are passed straight through.
+    """
+
+    def __init__(self, embeddings, window_ms=EMBED_BATCH_WINDOW_MS, max_batch_size=EMBED_MAX_BATCH_SIZE,
+                 timeout=EMBED_QUERY_TIMEOUT):
+        self.embeddings = embeddings
+        self.window = window_ms / 1000.0
+        self.max_batch_size = max(1, max_batch_size)
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, text):
+        """
+        Queue a query for the next batch.
+
+        Args:
+            text (str): The query to embed
+
+        Returns:
+            Future: Resolves to the embedding of the query
+        """
+        future = Future()
+        self._queue.put((text, future))
+        return future
+
+    def embed_query(self, text):
+        return self.submit(text).result(timeout=self.timeout)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    def _collect_batch(self):
+        # Block for the first query, then gather more until the window closes or the batch is full
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _embed_batch(self, batch):
+        # Identical queries arriving together only need to be embedded once
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        vectors = self.embeddings.embed_documents(texts)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Got {len(vectors)} embeddings for {len(texts)} queries")
+        vectors = dict(zip(texts, vectors))
+
+        if len(batch) > 1:
+            logging.debug(f"Embedded {len(batch)} queries in one batch")
+        for text, future in batch:
+            future.set_result(vectors[text])
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                batch = [(text, future) for text, future in self._collect_batch()
+                         if future.set_running_or_notify_cancel()]
+                if batch:
+                    self._embed_batch(batch)
+            except Exception as e:
+                # The worker must survive any error, otherwise every later caller waits forever
+                logging.error(f"Error embedding batch of {len(batch)} queries: {str(e)}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
@@ -0,0 +1,130 @@
+import os
+import json
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from langchain_ollama.llms import OllamaLLM
+from langchain.prompts import PromptTemplate
+from tqdm import tqdm
+
+from vector import DEDUP_ENABLED, load_parquet_files, deduplicate_recipes
+from search import LLM_NUM_CTX, OLLAMA_KEEP_ALIVE, build_leading_context
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+ENRICH_MAX_WORKERS = int(os.environ.get("ENRICH_MAX_WORKERS", "4"))
+
+ENRICH_TEMPLATE = """You are preparing a recipe search engine. Describe the recipe below for people browsing recipes.
+
+RECIPE:
+{content}
+
+Respond with a JSON object with these keys:
+"summary": a helpful 3-4 sentence summary of the dish, its main ingredients and how it is made,
+"tags": a list of up to 8 short lowercase tags (cuisine, course, main ingredients, diet, technique),
+"suggestions": a list of exactly 3 follow-up search queries a user who likes this recipe might try next."""
+
+
+def load_enriched_ids(output_path):
+    #Collect the ids that were already enriched in an earlier run
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, 'r') as f:
+        for line in f:
+            try:
+                done.add(json.loads(line)['id'])
+            except (ValueError, KeyError):
+                # A partially written last line from an interrupted run
+                continue
+    return done
+
+
+def enrich_recipe(llm, doc_id, content):
+    #Generate the query independent summary, tags and suggestions for one recipe
+    prompt = PromptTemplate(input_variables=["content"], template=ENRICH_TEMPLATE)
+    content = build_leading_context(content)
+    data = json.loads(llm.invoke(prompt.format(content=content)))
+
+    # Incomplete answers raise, so the recipe is not marked as done and is retried on the next run
+    summary = str(data.get("summary") or "").strip()
+    tags = data.get("tags")
+    suggestions = data.get("suggestions")
+    if not summary:
+        raise ValueError(f"No summary generated for recipe {doc_id}")
+    if not isinstance(tags, list) or not isinstance(suggestions, list):
+        raise ValueError(f"Tags or suggestions of recipe {doc_id} are not lists")
+
+    return {
+        "id": doc_id,
+        "summary": summary,
+        "tags": [str(tag).strip().lower() for tag in tags if str(tag).strip()][:8],
+        "suggestions": [str(s).strip() for s in suggestions if str(s).strip()][:3]
+    }
+
+
+def enrich_recipes(df, output_path, max_workers=ENRICH_MAX_WORKERS):
+    #Enrich all recipes that are not in the output file yet, appending one JSON line per recipe
+    llm = OllamaLLM(model="llama3.2", format="json", num_ctx=LLM_NUM_CTX, keep_alive=OLLAMA_KEEP_ALIVE)
+
+    done = load_enriched_ids(output_path)
+    if done:
+        logging.info(f"Resuming enrichment, {len(done)} recipes already done")
+    todo = [(str(idx), row["input"]) for idx, row in df.iterrows() if str(idx) not in done]
+    logging.info(f"Enriching {len(todo)} recipes with {max_workers} workers")
+
+    failed = 0
+    with open(output_path, 'a') as out, ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = set()
+        items = iter(todo)
+        progress = tqdm(total=len(todo), desc="Enriching recipes")
+
+        while True:
+            # Keep only a bounded number of recipes in flight
+            while len(pending) < max_workers * 2:
+                item = next(items, None)
+                if item is None:
+                    break
+                pending.add(executor.submit(enrich_recipe, llm, *item))
+            if not pending:
+                break
+
+            finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                try:
+                    out.write(json.dumps(future.result()) + '\n')
+                except Exception as e:
+                    failed += 1
+                    logging.error(f"Error enriching recipe: {str(e)}")
+                progress.update(1)
+            out.flush()
+
+        progress.close()
+
+    logging.info(f"Enrichment completed, {failed} recipes failed and will be retried on the next run")
+
+
+def main():
+    try:
+        # Setup paths
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        dataset_dir = os.path.join(os.path.dirname(current_dir), "datasets")
+        output_path = os.path.join(os.path.dirname(current_dir), "database", "enrichment.jsonl")
+
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        df = load_parquet_files(dataset_dir)
+        if DEDUP_ENABLED:
+            df = deduplicate_recipes(df)
+        enrich_recipes(df, output_path)
+
+    except Exception as e:
+        logging.error(f"An error occurred: {str(e)}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
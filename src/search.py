@@ -1,10 +1,21 @@
 import os
+import re
+import json
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from ollama import Client
 from langchain_ollama import OllamaEmbeddings
 from langchain_ollama.llms import OllamaLLM
 from langchain_chroma import Chroma
 from langchain.chains import LLMChain
 from langchain.prompts import PromptTemplate
+from session import ConversationSession
+from docstore import load_document_store
+from embedding_batcher import MicroBatchEmbeddings
+from shards import ShardedVectorStore
+from snapshot import SnapshotVectorStore
 
 #TODO: Remove deprecate functions (.chain -> invoke(), LLMChaine -> Sequence). But for now good enough, all the blogpost/stackoverflow postst use the deprecated libraries to
 
@@ -17,13 +28,58 @@ logging.basicConfig(
 logging.getLogger("httpx").setLevel(logging.WARNING)
 logging.getLogger("httpcore").setLevel(logging.WARNING)
 
+# Context window of the LLM and the share of it a single recipe may take up in a prompt
+LLM_NUM_CTX = int(os.environ.get("LLM_NUM_CTX", "2048"))
+PROMPT_CONTENT_TOKENS = int(os.environ.get("PROMPT_CONTENT_TOKENS", "768"))
 
-def load_models_and_db(db_path):
+# Keep the model loaded between requests so follow-up turns don't pay for a reload
+OLLAMA_KEEP_ALIVE = os.environ.get("OLLAMA_KEEP_ALIVE", "30m")
+
+# Rough average for llama tokenizers on english text, good enough for budgeting
+CHARS_PER_TOKEN = 4
+
+# Search the sharded index (see shards.py) instead of the single collection
+USE_SHARDED_INDEX = os.environ.get("SHARDED_INDEX", "0") == "1"
+
+# Serve straight from a memory-mapped index snapshot (see snapshot.py) instead of chroma
+INDEX_SNAPSHOT = os.environ.get("INDEX_SNAPSHOT")
+
+# Multi-document answers: how many recipes to compare and how many map-step LLM calls may run at once
+MULTI_DOC_RESULTS = int(os.environ.get("MULTI_DOC_RESULTS", "5"))
+MAP_MAX_WORKERS = int(os.environ.get("MAP_MAX_WORKERS", "4"))
+
+# Speculative retrieval: summarize the raw query's top hit while the query is being enhanced,
+# if it is at most this far from the query (squared L2 on normalized embeddings, 0 = identical)
+SPECULATION_MAX_DISTANCE = float(os.environ.get("SPECULATION_MAX_DISTANCE", "0.6"))
+SPECULATION_MAX_WORKERS = int(os.environ.get("SPECULATION_MAX_WORKERS", "8"))
+ENHANCEMENT_MAX_WORKERS = int(os.environ.get("ENHANCEMENT_MAX_WORKERS", "8"))
+
+# Words that don't need to be covered by a precomputed summary
+STOP_WORDS = {
+    "a", "an", "and", "the", "with", "for", "of", "in", "on", "to", "how", "what", "recipe",
+    "recipes", "make", "some", "me", "i", "my", "is", "are", "can", "do", "you", "want", "like"
+}
+
+# Layout of compressed recipes; long first lines are not treated as titles
+TITLE_MAX_TOKENS = 32
+INGREDIENTS_HEADER = "Ingredients:\n"
+DIRECTIONS_HEADER = "Directions:\n"
+SECTION_SEPARATOR = "\n\n"
+TRUNCATION_MARKER = "- ..."
+
+INGREDIENT_HEADERS = ("ingredients",)
+STEP_HEADERS = ("directions", "instructions", "steps", "method", "preparation")
+
+
+def load_models_and_db(db_path, micro_batching=False, sharded=USE_SHARDED_INDEX, snapshot_path=INDEX_SNAPSHOT):
     """
     Load and return the Chroma database and LLM.
 
     Args:
         db_path (str): Path to the Chroma database directory.
+        micro_batching (bool): Batch query embeddings of concurrent requests together.
+        sharded (bool): Search the sharded index built by shards.py next to db_path instead.
+        snapshot_path (str): Search a memory-mapped snapshot exported by snapshot.py instead.
 
     Returns:
         tuple: (vector_store, llm)
@@ -33,16 +89,23 @@ def load_models_and_db(db_path):
 
         # Initialize the embeddings model
         embeddings = OllamaEmbeddings(model="mxbai-embed-large")
+        if micro_batching:
+            embeddings = MicroBatchEmbeddings(embeddings)
 
         # Connect to the existing Chroma database
-        vector_store = Chroma(
-            collection_name="recipe_database",
-            persist_directory=db_path,
-            embedding_function=embeddings
-        )
+        if snapshot_path:
+            vector_store = SnapshotVectorStore(snapshot_path, embeddings)
+        elif sharded:
+            vector_store = ShardedVectorStore(os.path.join(os.path.dirname(db_path), "shards"), embeddings)
+        else:
+            vector_store = Chroma(
+                collection_name="recipe_database",
+                persist_directory=db_path,
+                embedding_function=embeddings
+            )
 
         # Initialize the LLM
-        llm = OllamaLLM(model="llama3.2")
+        llm = OllamaLLM(model="llama3.2", num_ctx=LLM_NUM_CTX, keep_alive=OLLAMA_KEEP_ALIVE)
 
         return vector_store, llm
 
@@ -87,7 +150,32 @@ Enhanced query:"""
         return user_query
 
 
-def query_chroma_db(vector_store, query_text, num_results=1):
+class LazyResult(dict):
+    """
+    Search result whose full content is only read from the document store when accessed.
+
+    Documents missing from the store are read from the vector store instead.
+    """
+
+    def __init__(self, docstore, doc_id, vector_store=None, **fields):
+        super().__init__(fields)
+        self._docstore = docstore
+        self._doc_id = doc_id
+        self._vector_store = vector_store
+
+    def __missing__(self, key):
+        if key != "content":
+            raise KeyError(key)
+        content = self._docstore.get(self._doc_id)
+        if content is None and self._vector_store is not None:
+            content = fetch_document_texts(self._vector_store, [self._doc_id]).get(self._doc_id)
+        if content is None:
+            raise KeyError(key)
+        self["content"] = content
+        return content
+
+
+def query_chroma_db(vector_store, query_text, num_results=1, docstore=None, query_embedding=None):
     """
     Query the Chroma database with the given text and return results.
 
@@ -95,12 +183,31 @@ def query_chroma_db(vector_store, query_text, num_results=1):
         vector_store (Chroma): The Chroma vector store.
         query_text (str): The text query to search for.
         num_results (int): Number of results to return.
+        docstore (DocumentStore): Optional document store; if given only ids and scores are
+            fetched from Chroma and the texts are read lazily from the store.
+        query_embedding (list): Optional precomputed embedding of query_text
 
     Returns:
         list: The most similar documents with their content and scores.
     """
+    if docstore is not None:
+        return query_index_ids(vector_store, query_text, num_results, docstore, query_embedding)
+
     try:
         logging.info(f"Querying database for: '{query_text}'")
+        if query_embedding is not None:
+            results = vector_store._collection.query(
+                query_embeddings=[query_embedding],
+                n_results=num_results,
+                include=["documents", "metadatas", "distances"]
+            )
+            return [
+                {"content": document, "metadata": metadata or {}, "similarity_score": score}
+                for document, metadata, score in zip(
+                    results["documents"][0], results["metadatas"][0], results["distances"][0]
+                )
+            ]
+
         # Perform similarity search
         results = vector_store.similarity_search_with_score(
             query=query_text,
@@ -122,14 +229,383 @@ def query_chroma_db(vector_store, query_text, num_results=1):
         return []
 
 
-def generate_content_summary(llm, content, query):
+def query_index_ids(vector_store, query_text, num_results, docstore, query_embedding=None):
+    """
+    Query Chroma for ids and scores only and attach the texts from the document store.
+
+    Args:
+        vector_store (Chroma): The Chroma vector store.
+        query_text (str): The text query to search for.
+        num_results (int): Number of results to return.
+        docstore (DocumentStore): The document store holding the texts.
+        query_embedding (list): Optional precomputed embedding of query_text
+
+    Returns:
+        list: Lazy results with a preview; the full content is read on first access.
+    """
+    try:
+        logging.info(f"Querying database for: '{query_text}'")
+        if query_embedding is None:
+            query_embedding = vector_store.embeddings.embed_query(query_text)
+        results = vector_store._collection.query(
+            query_embeddings=[query_embedding],
+            n_results=num_results,
+            include=["metadatas", "distances"]
+        )
+
+        previews = {doc_id: docstore.preview(doc_id, 500) for doc_id in results["ids"][0]}
+        # Ids the document store doesn't know (e.g. an index built before deduplication) are
+        # read from the collection instead
+        fallback = fetch_document_texts(
+            vector_store, [doc_id for doc_id, preview in previews.items() if preview is None])
+
+        formatted_results = []
+        for doc_id, metadata, score in zip(results["ids"][0], results["metadatas"][0], results["distances"][0]):
+            if previews[doc_id] is not None:
+                formatted_results.append(LazyResult(
+                    docstore,
+                    doc_id,
+                    vector_store,
+                    preview=previews[doc_id],
+                    metadata=metadata or {"id": doc_id},
+                    similarity_score=score
+                ))
+            elif doc_id in fallback:
+                formatted_results.append({
+                    "content": fallback[doc_id],
+                    "metadata": metadata or {"id": doc_id},
+                    "similarity_score": score
+                })
+            else:
+                logging.warning(f"Document {doc_id} is in neither the document store nor the index")
+
+        return formatted_results
+
+    except Exception as e:
+        logging.error(f"Error querying Chroma DB: {str(e)}")
+        return []
+
+
+def format_preview(result, max_chars=500):
+    """
+    Return the shortened content shown to the user.
+
+    Args:
+        result (dict): A search result.
+        max_chars (int): Maximum number of characters before the text is cut off.
+
+    Returns:
+        str: The preview.
+    """
+    if "preview" in result:
+        return result["preview"]
+
+    content_preview = result["content"]
+    if len(content_preview) > max_chars:
+        content_preview = content_preview[:max_chars] + "..."
+    return content_preview
+
+
+def embed_query(vector_store, query_text):
+    """
+    Embed a query with the embedding model of the vector store.
+
+    Args:
+        vector_store (Chroma): The Chroma vector store.
+        query_text (str): The text to embed.
+
+    Returns:
+        list: The embedding, or None if embedding failed.
+    """
+    try:
+        return vector_store.embeddings.embed_query(query_text)
+    except Exception as e:
+        logging.error(f"Error embedding query: {str(e)}")
+        return None
+
+
+def fetch_document_embeddings(vector_store, doc_ids):
+    """
+    Fetch the stored embeddings of the given documents.
+
+    Args:
+        vector_store (Chroma): The Chroma vector store.
+        doc_ids (list): Ids of the documents.
+
+    Returns:
+        dict: Mapping of document id to embedding.
+    """
+    try:
+        data = vector_store.get(ids=list(doc_ids), include=["embeddings"])
+        return dict(zip(data["ids"], data["embeddings"]))
+    except Exception as e:
+        logging.error(f"Error fetching document embeddings: {str(e)}")
+        return {}
+
+
+def fetch_document_texts(vector_store, doc_ids):
+    """
+    Fetch the stored texts of the given documents from the vector store.
+
+    Args:
+        vector_store (Chroma): The Chroma vector store.
+        doc_ids (list): Ids of the documents.
+
+    Returns:
+        dict: Mapping of document id to text, without documents that have no text.
+    """
+    if not doc_ids:
+        return {}
+    try:
+        data = vector_store.get(ids=list(doc_ids), include=["documents"])
+        return {doc_id: text for doc_id, text in zip(data["ids"], data["documents"]) if text}
+    except Exception as e:
+        logging.error(f"Error fetching document texts: {str(e)}")
+        return {}
+
+
+def estimate_tokens(text):
+    """
+    Estimate the number of tokens the LLM needs for the given text.
+
+    Args:
+        text (str): The text to measure
+
+    Returns:
+        int: Approximate token count
+    """
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def split_recipe_sections(content):
+    """
+    Split a recipe into its title, ingredient lines and step lines.
+
+    Args:
+        content (str): The recipe text as stored in the database
+
+    Returns:
+        tuple: (title, ingredients, steps)
+    """
+    title = ""
+    ingredients = []
+    steps = []
+    current = None
+
+    for line in content.splitlines():
+        stripped = line.strip()
+        if not stripped:
+            continue
+
+        header = stripped.lower().rstrip(':').strip()
+        if header in INGREDIENT_HEADERS:
+            current = ingredients
+            continue
+        if header in STEP_HEADERS:
+            current = steps
+            continue
+
+        if current is None and not title:
+            title = stripped
+        elif current is None:
+            # Text before any header is treated as part of the description
+            steps.append(stripped)
+        else:
+            current.append(stripped)
+
+    return title, ingredients, steps
+
+
+def score_sentences(sentences, query, embeddings=None, query_embedding=None):
+    """
+    Score sentences by their relevance to the query.
+
+    Uses cosine similarity against the query embedding when an embedding model is
+    available and falls back to simple word overlap otherwise.
+
+    Args:
+        sentences (list): The sentences to score
+        query (str): The user query
+        embeddings: Optional embedding model
+        query_embedding (list): Optional precomputed embedding of the query
+
+    Returns:
+        list: One score per sentence (higher is more relevant)
+    """
+    if embeddings is not None:
+        try:
+            if query_embedding is None:
+                query_embedding = embeddings.embed_query(query)
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            sentence_vectors = np.asarray(embeddings.embed_documents(sentences), dtype=np.float32)
+            norms = np.linalg.norm(sentence_vectors, axis=1) * np.linalg.norm(query_vector)
+            norms[norms == 0] = 1.0
+            return (sentence_vectors @ query_vector / norms).tolist()
+        except Exception as e:
+            logging.warning(f"Falling back to lexical sentence scoring: {str(e)}")
+
+    query_terms = set(re.findall(r"\w+", query.lower()))
+    scores = []
+    for sentence in sentences:
+        sentence_terms = set(re.findall(r"\w+", sentence.lower()))
+        scores.append(len(query_terms & sentence_terms) / (len(sentence_terms) + 1))
+    return scores
+
+
+def _take_lines(lines, max_tokens):
+    # Keep lines in order until the token budget is used up, including the truncation marker
+    marker_cost = estimate_tokens(TRUNCATION_MARKER)
+    kept = []
+    used = 0
+    for position, line in enumerate(lines):
+        cost = estimate_tokens(line)
+        is_last = position == len(lines) - 1
+        if used + cost + (0 if is_last else marker_cost) > max_tokens:
+            if used + marker_cost <= max_tokens:
+                kept.append(TRUNCATION_MARKER)
+            break
+        kept.append(line)
+        used += cost
+    return kept
+
+
+def truncate_to_tokens(text, max_tokens):
+    """
+    Cut text so that it fits the token budget, as a last resort.
+
+    Args:
+        text (str): The text to cut
+        max_tokens (int): Token budget
+
+    Returns:
+        str: The text, cut off if it exceeded the budget
+    """
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    return text[:max(0, (max_tokens - 1) * CHARS_PER_TOKEN - 3)] + "..."
+
+
+def build_bounded_context(content, query, embeddings=None, query_embedding=None,
+                          max_tokens=PROMPT_CONTENT_TOKENS):
+    """
+    Reduce a recipe to the parts most relevant to the query so it fits the token budget.
+
+    The (capped) title is always kept, the ingredients get up to 40% of the budget and the
+    remaining budget is filled with the step sentences that score best against the
+    query, kept in their original order.
+
+    Args:
+        content (str): The full recipe text
+        query (str): The user query
+        embeddings: Optional embedding model used for sentence scoring
+        query_embedding (list): Optional precomputed embedding of the query
+        max_tokens (int): Token budget for the returned content
+
+    Returns:
+        str: The content, compressed if it exceeded the budget
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return content
+
+    title, ingredients, steps = split_recipe_sections(content)
+    if estimate_tokens(title) > TITLE_MAX_TOKENS:
+        # Not a real title (e.g. a recipe without line breaks), score it like the steps
+        steps.insert(0, title)
+        title = truncate_to_tokens(title, TITLE_MAX_TOKENS)
+
+    # Section headers and the blank lines between sections cost tokens too
+    budget = max_tokens - estimate_tokens(title) - 2 * estimate_tokens(SECTION_SEPARATOR)
+
+    ingredient_lines = []
+    if ingredients:
+        header_cost = estimate_tokens(INGREDIENTS_HEADER)
+        ingredient_lines = _take_lines(ingredients, int(budget * 0.4) - header_cost)
+        if ingredient_lines:
+            budget -= header_cost + sum(estimate_tokens(line) for line in ingredient_lines)
+
+    sentences = []
+    for step in steps:
+        step = step[2:] if step.startswith("- ") else step
+        sentences.extend(part.strip() for part in re.split(r"(?<=[.!?])\s+", step) if part.strip())
+
+    selected = []
+    budget -= estimate_tokens(DIRECTIONS_HEADER)
+    if sentences and budget > 0:
+        scores = score_sentences(sentences, query, embeddings, query_embedding)
+        used = 0
+        for index in sorted(range(len(sentences)), key=lambda i: scores[i], reverse=True):
+            cost = estimate_tokens(f"- {sentences[index]}")
+            if used + cost > budget:
+                continue
+            selected.append(index)
+            used += cost
+
+    parts = [title]
+    if ingredient_lines:
+        parts.append(INGREDIENTS_HEADER + "\n".join(ingredient_lines))
+    if selected:
+        parts.append(DIRECTIONS_HEADER + "\n".join(f"- {sentences[i]}" for i in sorted(selected)))
+
+    bounded = truncate_to_tokens(SECTION_SEPARATOR.join(part for part in parts if part), max_tokens)
+    logging.info(f"Compressed content from ~{estimate_tokens(content)} to ~{estimate_tokens(bounded)} tokens")
+    return bounded
+
+
+def build_leading_context(content, max_tokens=PROMPT_CONTENT_TOKENS):
+    """
+    Reduce a recipe to its title, ingredients and leading steps so it fits the token budget.
+
+    For prompts without a user query, e.g. the precomputed enrichment, where there is
+    nothing to score the steps against.
+
+    Args:
+        content (str): The full recipe text
+        max_tokens (int): Token budget for the returned content
+
+    Returns:
+        str: The content, cut down if it exceeded the budget
+    """
+    if estimate_tokens(content) <= max_tokens:
+        return content
+
+    title, ingredients, steps = split_recipe_sections(content)
+    if estimate_tokens(title) > TITLE_MAX_TOKENS:
+        # Not a real title (e.g. a recipe without line breaks), keep its start as the first step
+        steps.insert(0, title)
+        title = truncate_to_tokens(title, TITLE_MAX_TOKENS)
+
+    budget = max_tokens - estimate_tokens(title) - 2 * estimate_tokens(SECTION_SEPARATOR)
+    parts = [title]
+
+    if ingredients:
+        header_cost = estimate_tokens(INGREDIENTS_HEADER)
+        ingredient_lines = _take_lines(ingredients, int(budget * 0.4) - header_cost)
+        if ingredient_lines:
+            parts.append(INGREDIENTS_HEADER + "\n".join(ingredient_lines))
+            budget -= header_cost + sum(estimate_tokens(line) for line in ingredient_lines)
+
+    budget -= estimate_tokens(DIRECTIONS_HEADER)
+    if steps and budget > 0:
+        parts.append(DIRECTIONS_HEADER + truncate_to_tokens("\n".join(steps), budget))
+
+    bounded = truncate_to_tokens(SECTION_SEPARATOR.join(part for part in parts if part), max_tokens)
+    logging.info(f"Cut content from ~{estimate_tokens(content)} to ~{estimate_tokens(bounded)} tokens")
+    return bounded
+
+
+def generate_content_summary(llm, content, query, embeddings=None, query_embedding=None):
     """
     Use the LLM to generate a helpful summary of the content based on the query.
 
+    Content that already went through build_bounded_context is used as is, so callers
+    can bound a recipe once and share it with suggest_next_queries.
+
     Args:
         llm: The LLM model
         content (str): The content to summarize
         query (str): The original query
+        embeddings: Optional embedding model used to pick the relevant parts of long content
+        query_embedding (list): Optional precomputed embedding of the query
 
     Returns:
         str: A summary of the content
@@ -157,6 +633,7 @@ SUMMARY:"""
     chain = LLMChain(llm=llm, prompt=prompt)
 
     try:
+        content = build_bounded_context(content, query, embeddings, query_embedding)
         summary = chain.run(query=query, content=content).strip()
         return summary
     except Exception as e:
@@ -164,14 +641,16 @@ SUMMARY:"""
         return "Error generating summary."
 
 
-def suggest_next_queries(llm, content, current_query):
+def suggest_next_queries(llm, content, current_query, embeddings=None, query_embedding=None):
     """
     Use the LLM to suggest related queries the user might want to try next.
 
     Args:
         llm: The LLM model
-        content (str): The content to analyze
+        content (str): The content to analyze, used as is if it is already bounded
         current_query (str): The current query
+        embeddings: Optional embedding model used to pick the relevant parts of long content
+        query_embedding (list): Optional precomputed embedding of the query
 
     Returns:
         list: Suggested next queries
@@ -200,6 +679,7 @@ SUGGESTED QUERIES:
     chain = LLMChain(llm=llm, prompt=prompt)
 
     try:
+        content = build_bounded_context(content, current_query, embeddings, query_embedding)
         suggestions = chain.run(current_query=current_query, content=content).strip()
 
         # Process the output into a list
@@ -219,18 +699,380 @@ SUGGESTED QUERIES:
         return ["No suggestions available."]
 
 
-def print_enhanced_result(result, query, llm):
-    #Print a single result with "enhanced" information
+def load_enrichment(path):
+    """
+    Load the precomputed summaries, tags and suggestions written by enrich.py.
+
+    Args:
+        path (str): Path to the enrichment JSONL file
+
+    Returns:
+        dict: Mapping of document id to its enrichment, empty if the file does not exist
+    """
+    enrichment = {}
+    if not os.path.exists(path):
+        return enrichment
+
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                enrichment[record["id"]] = record
+            except (ValueError, KeyError):
+                continue
+
+    logging.info(f"Loaded precomputed enrichment for {len(enrichment)} recipes")
+    return enrichment
+
+
+def needs_refinement(enrichment, content, query):
+    """
+    Check whether a precomputed summary leaves parts of the query unanswered.
+
+    Args:
+        enrichment (dict): The precomputed fields of the recipe
+        content (str): The recipe text
+        query (str): The user query
+
+    Returns:
+        bool: True if the query mentions terms the title, tags and summary don't cover
+    """
+    covered = " ".join([
+        split_recipe_sections(content)[0],
+        " ".join(enrichment.get("tags", [])),
+        enrichment.get("summary", "")
+    ]).lower()
+    terms = [term for term in re.findall(r"\w+", query.lower()) if term not in STOP_WORDS and len(term) > 2]
+    return any(term not in covered for term in terms)
+
+
+def refine_precomputed_summary(llm, enrichment, content, query, embeddings=None, query_embedding=None):
+    """
+    Adapt a precomputed, query independent summary to the user's query.
+
+    Args:
+        llm: The LLM model
+        enrichment (dict): The precomputed fields of the recipe
+        content (str): The recipe text
+        query (str): The user query
+        embeddings: Optional embedding model used to pick the relevant parts of long content
+        query_embedding (list): Optional precomputed embedding of the query
+
+    Returns:
+        str: The refined summary, or the precomputed one if refinement fails
+    """
+    template = """You are a helpful AI assistant. A user searched for a recipe and we already have a general summary of it.
+Add 1-2 sentences to the summary that answer what the user asked for, based on the recipe excerpt.
+
+USER QUERY: {query}
+
+SUMMARY:
+{summary}
+
+RECIPE EXCERPT:
+{content}
+
+REFINED SUMMARY:"""
+
+    prompt = PromptTemplate(
+        input_variables=["query", "summary", "content"],
+        template=template,
+    )
+
+    chain = LLMChain(llm=llm, prompt=prompt)
+
+    try:
+        content = build_bounded_context(content, query, embeddings, query_embedding,
+                                        max_tokens=PROMPT_CONTENT_TOKENS // 2)
+        return chain.run(query=query, summary=enrichment["summary"], content=content).strip()
+    except Exception as e:
+        logging.error(f"Error refining summary: {str(e)}")
+        return enrichment["summary"]
+
+
+def summarize_document_for_comparison(llm, content, query, embeddings=None, query_embedding=None):
+    """
+    Map step: condense a single recipe into a short, query-focused note.
+
+    Args:
+        llm: The LLM model
+        content (str): The recipe to condense
+        query (str): The user query
+        embeddings: Optional embedding model used to pick the relevant parts of long content
+        query_embedding (list): Optional precomputed embedding of the query
+
+    Returns:
+        str: A short note about the recipe
+    """
+    template = """You are helping to compare several recipes for a user.
+Write 2-3 sentences about the recipe below that capture what matters for the user's query
+(main ingredients, effort, time, what makes it different).
+
+USER QUERY: {query}
+
+RECIPE:
+{content}
+
+NOTE:"""
+
+    prompt = PromptTemplate(
+        input_variables=["query", "content"],
+        template=template,
+    )
+
+    chain = LLMChain(llm=llm, prompt=prompt)
+
+    try:
+        content = build_bounded_context(content, query, embeddings, query_embedding)
+        return chain.run(query=query, content=content).strip()
+    except Exception as e:
+        logging.error(f"Error summarizing document: {str(e)}")
+        return "No summary available."
+
+
+def summarize_documents_parallel(llm, results, query, embeddings=None, max_workers=MAP_MAX_WORKERS,
+                                 query_embedding=None):
+    """
+    Run the map step over all retrieved recipes with bounded concurrency.
+
+    Args:
+        llm: The LLM model
+        results (list): Results as returned by query_chroma_db
+        query (str): The user query
+        embeddings: Optional embedding model used to pick the relevant parts of long content
+        max_workers (int): Maximum number of concurrent LLM calls
+        query_embedding (list): Optional precomputed embedding of the query, shared by all recipes
+
+    Returns:
+        list: One dict per result with title, summary and similarity score, in result order
+    """
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        summaries = list(executor.map(
+            lambda result: summarize_document_for_comparison(llm, result["content"], query, embeddings,
+                                                             query_embedding),
+            results
+        ))
+
+    return [
+        {
+            "title": split_recipe_sections(result["content"])[0],
+            "summary": summary,
+            "metadata": result["metadata"],
+            "similarity_score": result["similarity_score"]
+        }
+        for result, summary in zip(results, summaries)
+    ]
+
+
+def stream_comparative_answer(llm, summaries, query):
+    """
+    Reduce step: stream one answer that compares the summarized recipes.
+
+    Args:
+        llm: The LLM model
+        summaries (list): Output of summarize_documents_parallel
+        query (str): The user query
+
+    Yields:
+        str: Chunks of the answer as the LLM generates them
+    """
+    template = """You are a helpful culinary assistant.
+The user asked a question and we found several matching recipes. Using only the notes below,
+write one answer that compares the recipes, points out their differences and recommends the best fit.
+
+USER QUERY: {query}
+
+RECIPES:
+{recipes}
+
+ANSWER:"""
+
+    prompt = PromptTemplate(
+        input_variables=["query", "recipes"],
+        template=template,
+    )
+
+    recipes = "\n\n".join(
+        f"{i}. {item['title']}\n{item['summary']}" for i, item in enumerate(summaries, 1)
+    )
+
+    try:
+        for chunk in llm.stream(prompt.format(query=query, recipes=recipes)):
+            yield chunk
+    except Exception as e:
+        logging.error(f"Error generating comparative answer: {str(e)}")
+        yield "Error generating answer."
+
+
+def answer_follow_up(llm, document, query, embeddings=None, query_embedding=None):
+    """
+    Answer a follow-up question about a document from an earlier turn.
+
+    The Ollama context of the previous answer about the same document is reused, so the
+    recipe only has to be prefilled once per conversation. The document's "llm_context"
+    is updated in place.
+
+    Args:
+        llm: The LLM model
+        document (dict): A document remembered by a ConversationSession
+        query (str): The follow-up question
+        embeddings: Optional embedding model used to pick the relevant parts of long content
+        query_embedding (list): Optional precomputed embedding of the question
+
+    Returns:
+        str: The answer
+    """
+    context = document.get("llm_context")
+    if context and len(context) > LLM_NUM_CTX * 3 // 4:
+        # The conversation is about to overflow the context window, start over with the recipe
+        context = None
+
+    if context:
+        prompt = f"""FOLLOW-UP QUESTION: {query}
+
+ANSWER:"""
+    else:
+        content = build_bounded_context(document["content"], query, embeddings, query_embedding)
+        prompt = f"""You are a helpful culinary assistant. Answer the user's questions about the recipe below.
+Keep your answers short and stick to the recipe.
+
+RECIPE:
+{content}
+
+QUESTION: {query}
+
+ANSWER:"""
+
+    try:
+        response = Client(host=llm.base_url).generate(
+            model=llm.model,
+            prompt=prompt,
+            context=context,
+            keep_alive=OLLAMA_KEEP_ALIVE,
+            options={"num_ctx": LLM_NUM_CTX}
+        )
+        document["llm_context"] = response["context"]
+        return response["response"].strip()
+    except Exception as e:
+        logging.error(f"Error answering follow-up: {str(e)}")
+        return "Error generating answer."
+
+
+class SpeculationStats:
+    """
+    Thread-safe counters of how speculative retrievals turned out.
+
+    won: the enhanced query found the same top recipe, the speculative work was used
+    lost: the enhanced query found a different recipe, the speculative work was discarded
+    skipped: the raw query's top hit was not confident enough to speculate on
+    unverified: the enhanced retrieval returned nothing, the speculative work was used unchecked
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts = {"won": 0, "lost": 0, "skipped": 0, "unverified": 0}
+
+    def record(self, outcome):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def as_dict(self):
+        with self._lock:
+            counts = dict(self.counts)
+        speculated = counts["won"] + counts["lost"]
+        counts["win_rate"] = counts["won"] / speculated if speculated else None
+        return counts
+
+
+speculation_stats = SpeculationStats()
+
+# Shared so discarded speculative work can finish in the background without blocking the request
+_speculation_executor = ThreadPoolExecutor(max_workers=SPECULATION_MAX_WORKERS)
+# Query enhancement is on the critical path, it never queues behind speculative summaries
+_enhancement_executor = ThreadPoolExecutor(max_workers=ENHANCEMENT_MAX_WORKERS)
+
+
+def speculative_search(llm, vector_store, user_query, docstore=None, query_embedding=None):
+    """
+    Retrieve with the raw query while the query is being enhanced.
+
+    If the raw query's top hit is confident, its summary and suggestions are generated
+    right away. Once the enhanced query has been searched, the speculative work is kept if
+    both queries found the same recipe and cancelled or discarded otherwise.
+
+    Args:
+        llm: The LLM model
+        vector_store (Chroma): The Chroma vector store
+        user_query (str): The original user query
+        docstore (DocumentStore): Optional document store
+        query_embedding (list): Optional precomputed embedding of user_query
+
+    Returns:
+        tuple: (results, speculated) where speculated is a dict with summary and suggestions
+            for results[0], or None if the caller has to generate them.
+    """
+    embeddings = vector_store.embeddings
+    enhanced_future = _enhancement_executor.submit(enhance_query, llm, user_query)
+    raw_results = query_chroma_db(vector_store, user_query, num_results=1, docstore=docstore,
+                                  query_embedding=query_embedding)
+
+    summary_future = None
+    suggestions_future = None
+    if raw_results and raw_results[0]["similarity_score"] <= SPECULATION_MAX_DISTANCE:
+        # Bounded once, both prompts get the same excerpt
+        content = build_bounded_context(raw_results[0]["content"], user_query, embeddings, query_embedding)
+        summary_future = _speculation_executor.submit(
+            generate_content_summary, llm, content, user_query)
+        suggestions_future = _speculation_executor.submit(
+            suggest_next_queries, llm, content, user_query)
+
+    enhanced_results = query_chroma_db(vector_store, enhanced_future.result(), num_results=1, docstore=docstore)
+
+    if summary_future is None:
+        speculation_stats.record("skipped")
+        return enhanced_results or raw_results, None
+
+    if not enhanced_results:
+        # Nothing to compare against (e.g. the retrieval failed), so this is neither a win nor a loss
+        speculation_stats.record("unverified")
+        logging.info("Enhanced retrieval returned nothing, serving the raw query's top hit")
+        return raw_results, {
+            "summary": summary_future.result(),
+            "suggestions": suggestions_future.result()
+        }
+
+    raw_id = raw_results[0]["metadata"].get("id")
+    if enhanced_results[0]["metadata"].get("id") != raw_id:
+        # Only futures that haven't started can be cancelled, running ones finish in the background
+        summary_future.cancel()
+        suggestions_future.cancel()
+        speculation_stats.record("lost")
+        logging.info("Speculative retrieval lost, enhanced query found a different recipe")
+        return enhanced_results, None
+
+    speculation_stats.record("won")
+    logging.info("Speculative retrieval won, reusing summary of the raw query's top hit")
+    return enhanced_results, {
+        "summary": summary_future.result(),
+        "suggestions": suggestions_future.result()
+    }
+
+
+def print_enhanced_result(result, query, llm, embeddings=None, query_embedding=None):
+    #Print a single result with "enhanced" information and return the suggested queries
     if not result:
         print("\nNo matching results found.")
-        return
+        return []
 
     print(f"\n{'=' * 80}")
     print(f"Search Results for: '{query}'")
     print(f"{'=' * 80}")
 
+    # The summary and the suggestions share one bounded excerpt of the recipe
+    content = build_bounded_context(result["content"], query, embeddings, query_embedding)
+
     # Generate and display the summary
-    content_summary = generate_content_summary(llm, result["content"], query)
+    content_summary = generate_content_summary(llm, content, query)
     print("\n  SUMMARY:")
     print(f"{content_summary}")
 
@@ -238,9 +1080,7 @@ def print_enhanced_result(result, query, llm):
     print(f"\nRelevance Score: {result['similarity_score']:.4f}")
 
     # Display original content (shortened for readability)
-    content_preview = result["content"]
-    if len(content_preview) > 500:
-        content_preview = content_preview[:500] + "..."
+    content_preview = format_preview(result)
 
     print("\nCONTENT PREVIEW:")
     print(f"{content_preview}")
@@ -250,12 +1090,13 @@ def print_enhanced_result(result, query, llm):
     print(f"{result['metadata']}")
 
     # Generate and display suggested next queries
-    suggested_queries = suggest_next_queries(llm, result["content"], query)
+    suggested_queries = suggest_next_queries(llm, content, query)
     print("\nYOU MIGHT ALSO WANT TO ASK:")
     for i, suggestion in enumerate(suggested_queries, 1):
         print(f"  {i}. {suggestion}")
 
     print(f"{'=' * 80}")
+    return suggested_queries
 
 
 def interactive_query_loop(db_path):
@@ -263,15 +1104,18 @@ def interactive_query_loop(db_path):
     try:
         # Load the database and LLM once
         vector_store, llm = load_models_and_db(db_path)
+        docstore = load_document_store(os.path.join(os.path.dirname(db_path), "docstore"))
 
         print("\n ENHANCED CHROMA DB QUERY ")
         print("Type your query and press Enter to search.")
         print("To exit, type 'quit', 'exit', or press Ctrl+C.")
         print("For raw results without LLM enhancement, start your query with 'raw:'")
+        print("To compare several matching recipes, start your query with 'multi:'")
         print("To use a suggested query, type its number (1-3)")
         print("=" * 50)
 
         last_suggestions = []
+        session = ConversationSession("cli")
 
         while True:
             # Get user query
@@ -298,6 +1142,23 @@ def interactive_query_loop(db_path):
                 raw_mode = True
                 query = query[4:].strip()
 
+            # Determine if we should answer from several documents
+            multi_mode = False
+            if not raw_mode and query.lower().startswith('multi:'):
+                multi_mode = True
+                query = query[6:].strip()
+
+            # Embedded once, reused for follow-up detection, retrieval and picking the relevant content
+            query_embedding = embed_query(vector_store, query)
+
+            # Answer follow-ups about earlier results without a new retrieval
+            if not raw_mode and not multi_mode and session.documents:
+                document = session.find_follow_up_document(query, query_embedding)
+                if document is not None:
+                    print(f"\nAbout: {split_recipe_sections(document['content'])[0]}")
+                    print(answer_follow_up(llm, document, query, vector_store.embeddings, query_embedding))
+                    continue
+
             # Enhance the query unless in raw mode
             if not raw_mode:
                 enhanced_query = enhance_query(llm, query)
@@ -305,7 +1166,9 @@ def interactive_query_loop(db_path):
                 enhanced_query = query
 
             # Get results
-            results = query_chroma_db(vector_store, enhanced_query, num_results=1)
+            num_results = MULTI_DOC_RESULTS if multi_mode else 1
+            results = query_chroma_db(vector_store, enhanced_query, num_results=num_results, docstore=docstore,
+                                      query_embedding=query_embedding if enhanced_query == query else None)
 
             if not results:
                 print("\nNo matching results found.")
@@ -320,12 +1183,28 @@ def interactive_query_loop(db_path):
                 print(f"Content: {results[0]['content']}")
                 print(f"Metadata: {results[0]['metadata']}")
                 print("=" * 80)
+            elif multi_mode:
+                # Summarize every recipe in parallel, then stream one comparative answer
+                summaries = summarize_documents_parallel(llm, results, query, vector_store.embeddings,
+                                                         query_embedding=query_embedding)
+                print(f"\nComparing {len(summaries)} recipes for: '{query}'")
+                print("=" * 80)
+                for i, item in enumerate(summaries, 1):
+                    print(f"  {i}. {item['title']} (Score: {item['similarity_score']:.4f})")
+                print("\nANSWER:")
+                for chunk in stream_comparative_answer(llm, summaries, query):
+                    print(chunk, end="", flush=True)
+                print(f"\n{'=' * 80}")
             else:
-                # Enhanced display with LLM summaries and suggestions
-                print_enhanced_result(results[0], query, llm)
-
-                # Store suggestions for next iteration
-                last_suggestions = suggest_next_queries(llm, results[0]["content"], query)
+                # Enhanced display with LLM summaries and suggestions, kept for the next iteration
+                last_suggestions = print_enhanced_result(results[0], query, llm, vector_store.embeddings,
+                                                         query_embedding)
+
+                # Remember the result so follow-up questions can reuse it
+                doc_id = results[0]["metadata"].get("id")
+                if doc_id is not None:
+                    embedding = fetch_document_embeddings(vector_store, [doc_id]).get(doc_id)
+                    session.remember_document(doc_id, results[0], embedding, suggestions=last_suggestions)
 
     except KeyboardInterrupt:
         print("\nExiting. Goodbye!")
@@ -0,0 +1,167 @@
+import os
+import re
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+# Bounds for the in-memory session store
+SESSION_MAX_SESSIONS = int(os.environ.get("SESSION_MAX_SESSIONS", "256"))
+SESSION_TTL_SECONDS = int(os.environ.get("SESSION_TTL_SECONDS", "1800"))
+SESSION_MAX_DOCUMENTS = int(os.environ.get("SESSION_MAX_DOCUMENTS", "10"))
+
+# A query counts as a follow-up if it is semantically close to a remembered result; an explicit
+# reference like "that recipe" lowers the similarity needed, but never replaces the check
+FOLLOW_UP_SIMILARITY = float(os.environ.get("FOLLOW_UP_SIMILARITY", "0.75"))
+FOLLOW_UP_REFERENCE_SIMILARITY = float(os.environ.get("FOLLOW_UP_REFERENCE_SIMILARITY", "0.5"))
+FOLLOW_UP_REFERENCE = re.compile(
+    r"\b(this|that|the (same|previous|last|first|second|third|above)) (one|recipe|dish)\b",
+    re.IGNORECASE
+)
+
+
+class ConversationSession:
+    """
+    State of a single conversation: the recipes shown so far, their summaries,
+    embeddings and the Ollama context of the last generation about them.
+    """
+
+    def __init__(self, session_id):
+        self.session_id = session_id
+        self.documents = OrderedDict()
+        self.last_suggestions = []
+        self.last_used = time.monotonic()
+        self.lock = threading.Lock()
+
+    def get_document(self, doc_id):
+        """Return a remembered document and mark it as most recently used."""
+        document = self.documents.get(doc_id)
+        if document is not None:
+            self.documents.move_to_end(doc_id)
+        return document
+
+    def remember_document(self, doc_id, result, embedding=None, summary=None, suggestions=None):
+        """
+        Store a retrieved document so later turns can reuse it.
+
+        Args:
+            doc_id (str): Id of the document in the vector store
+            result (dict): Result as returned by query_chroma_db
+            embedding (list): Embedding of the document
+            summary (str): Summary shown to the user
+            suggestions (list): Follow-up suggestions shown to the user
+
+        Returns:
+            dict: The remembered document
+        """
+        document = self.documents.get(doc_id, {})
+        document.update({
+            "id": doc_id,
+            "content": result["content"],
+            "metadata": result["metadata"],
+            "similarity_score": result["similarity_score"],
+        })
+        if embedding is not None:
+            document["embedding"] = np.asarray(embedding, dtype=np.float32)
+        if summary is not None:
+            document["summary"] = summary
+        if suggestions is not None:
+            document["suggestions"] = suggestions
+        document.setdefault("llm_context", None)
+
+        self.documents[doc_id] = document
+        self.documents.move_to_end(doc_id)
+        while len(self.documents) > SESSION_MAX_DOCUMENTS:
+            self.documents.popitem(last=False)
+        return document
+
+    def find_follow_up_document(self, query, query_embedding, min_similarity=FOLLOW_UP_SIMILARITY):
+        """
+        Find the remembered document a follow-up query refers to.
+
+        Args:
+            query (str): The user query
+            query_embedding (list): Embedding of the query
+            min_similarity (float): Cosine similarity needed without an explicit reference
+
+        Returns:
+            dict: The referenced document, or None if the query is not a follow-up
+        """
+        if not self.documents or query_embedding is None:
+            return None
+
+        if FOLLOW_UP_REFERENCE.search(query):
+            min_similarity = min(min_similarity, FOLLOW_UP_REFERENCE_SIMILARITY)
+
+        best_document = None
+        best_similarity = -1.0
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        query_norm = np.linalg.norm(query_vector) or 1.0
+        for document in self.documents.values():
+            embedding = document.get("embedding")
+            if embedding is None:
+                continue
+            similarity = float(embedding @ query_vector / ((np.linalg.norm(embedding) or 1.0) * query_norm))
+            if similarity > best_similarity:
+                best_document, best_similarity = document, similarity
+
+        if best_similarity >= min_similarity:
+            return best_document
+        return None
+
+
+class SessionStore:
+    """
+    Bounded in-memory session store with least-recently-used and idle-time eviction.
+    """
+
+    def __init__(self, max_sessions=SESSION_MAX_SESSIONS, ttl_seconds=SESSION_TTL_SECONDS):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, session_id=None):
+        """
+        Return the session for the given id, creating a new one if it is unknown or expired.
+
+        Args:
+            session_id (str): Id sent by the client, may be None
+
+        Returns:
+            ConversationSession: The session
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._evict_expired(now)
+
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = ConversationSession(session_id or uuid.uuid4().hex)
+                self._sessions[session.session_id] = session
+                while len(self._sessions) > self.max_sessions:
+                    evicted_id, _ = self._sessions.popitem(last=False)
+                    logging.info(f"Evicted session {evicted_id}")
+
+            self._sessions.move_to_end(session.session_id)
+            session.last_used = now
+            return session
+
+    def discard(self, session_id):
+        """Forget a session, e.g. when the user clears the chat."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict_expired(self, now):
+        # Sessions are ordered by last use, so expired ones are at the front
+        while self._sessions:
+            session_id, session = next(iter(self._sessions.items()))
+            if now - session.last_used <= self.ttl_seconds:
+                break
+            self._sessions.popitem(last=False)
+            logging.info(f"Expired session {session_id}")
@@ -0,0 +1,217 @@
+import os
+import json
+import heapq
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import chromadb
+from langchain_core.documents import Document
+
+from vector import DEDUP_ENABLED, load_parquet_files, deduplicate_recipes, create_vector_store
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", str(os.cpu_count() or 4)))
+SHARD_WORKERS = int(os.environ.get("SHARD_WORKERS", str(os.cpu_count() or 4)))
+COLLECTION_NAME = "recipe_database"
+MANIFEST_FILE = "manifest.json"
+
+
+def shard_path(shards_dir, shard_index):
+    #Every shard gets its own directory so checkpoints of parallel builds don't collide
+    return os.path.join(shards_dir, f"shard_{shard_index:03d}", "chroma_db")
+
+
+def shard_of(doc_id, num_shards):
+    #Hash partition by recipe id
+    return int(doc_id) % num_shards
+
+
+def build_shard(shard_index, shard_df, shards_dir):
+    #Build the index of a single shard, runs in a worker process
+    path = shard_path(shards_dir, shard_index)
+    os.makedirs(path, exist_ok=True)
+    logging.info(f"Building shard {shard_index} with {len(shard_df)} recipes")
+    create_vector_store(shard_df, path)
+    return shard_index
+
+
+def build_sharded_index(df, shards_dir, num_shards=SHARD_COUNT, max_workers=SHARD_WORKERS):
+    #Partition the recipes by id and build every shard in its own process
+    os.makedirs(shards_dir, exist_ok=True)
+    with open(os.path.join(shards_dir, MANIFEST_FILE), 'w') as f:
+        json.dump({"num_shards": num_shards, "partition": "id_mod"}, f)
+
+    shard_ids = df.index.to_series().astype(int) % num_shards
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(build_shard, i, df[shard_ids == i], shards_dir)
+            for i in range(num_shards)
+        ]
+        for future in as_completed(futures):
+            logging.info(f"Shard {future.result()} completed")
+
+    logging.info(f"Sharded index with {num_shards} shards completed")
+
+
+# Collections opened by a search worker process, keyed by shard index
+_worker_collections = {}
+_worker_shard_paths = []
+
+
+def _init_search_worker(shard_paths):
+    global _worker_shard_paths
+    _worker_shard_paths = shard_paths
+
+
+def _worker_collection(shard_index):
+    if shard_index not in _worker_collections:
+        client = chromadb.PersistentClient(path=_worker_shard_paths[shard_index])
+        _worker_collections[shard_index] = client.get_collection(COLLECTION_NAME)
+    return _worker_collections[shard_index]
+
+
+def _query_shard(shard_index, query_embeddings, n_results, include):
+    return _worker_collection(shard_index).query(
+        query_embeddings=query_embeddings,
+        n_results=n_results,
+        include=include
+    )
+
+
+def _get_from_shard(shard_index, ids, include):
+    return _worker_collection(shard_index).get(ids=ids, include=include)
+
+
+class ShardedCollection:
+    """
+    Scatter-gather view over all shards with the query/get interface of a chroma collection.
+
+    Queries are sent to every shard concurrently through a process pool and the per-shard
+    top-k lists are merged by distance.
+    """
+
+    def __init__(self, shards_dir, max_workers=SHARD_WORKERS):
+        with open(os.path.join(shards_dir, MANIFEST_FILE), 'r') as f:
+            self.num_shards = json.load(f)["num_shards"]
+
+        shard_paths = [shard_path(shards_dir, i) for i in range(self.num_shards)]
+        # Spawned, not forked: the web server forks from a process that already runs threads
+        # (request handlers, the embedding batcher), and a forked child can inherit a held lock
+        self._pool = ProcessPoolExecutor(
+            max_workers=min(max_workers, self.num_shards),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_search_worker,
+            initargs=(shard_paths,)
+        )
+
+    def query(self, query_embeddings, n_results=10, include=("metadatas", "documents", "distances")):
+        include = list(include)
+        if "distances" not in include:
+            include.append("distances")
+
+        futures = [
+            self._pool.submit(_query_shard, i, query_embeddings, n_results, include)
+            for i in range(self.num_shards)
+        ]
+        shard_results = [future.result() for future in futures]
+
+        merged = {"ids": []}
+        for key in include:
+            merged[key] = []
+
+        for query_index in range(len(query_embeddings)):
+            candidates = []
+            for result in shard_results:
+                for position, doc_id in enumerate(result["ids"][query_index]):
+                    candidates.append((result["distances"][query_index][position], doc_id, result, position))
+
+            top = heapq.nsmallest(n_results, candidates, key=lambda candidate: candidate[0])
+            merged["ids"].append([doc_id for _, doc_id, _, _ in top])
+            for key in include:
+                merged[key].append([result[key][query_index][position] for _, _, result, position in top])
+
+        return merged
+
+    def get(self, ids, include=("metadatas", "documents")):
+        # Ids are hash partitioned, so each id is only looked up in its own shard
+        by_shard = {}
+        for doc_id in ids:
+            by_shard.setdefault(shard_of(doc_id, self.num_shards), []).append(doc_id)
+
+        futures = [
+            self._pool.submit(_get_from_shard, shard_index, shard_ids, list(include))
+            for shard_index, shard_ids in by_shard.items()
+        ]
+
+        merged = {"ids": []}
+        for key in include:
+            merged[key] = []
+        for future in futures:
+            result = future.result()
+            merged["ids"].extend(result["ids"])
+            for key in include:
+                merged[key].extend(result[key])
+        return merged
+
+
+class CollectionVectorStore:
+    """
+    Drop-in replacement for the langchain Chroma store used by search.py, backed by any
+    object with the query/get interface of a chroma collection.
+    """
+
+    def __init__(self, collection, embeddings):
+        self.embeddings = embeddings
+        # Same attribute name as langchain's Chroma, so search.py can use either store
+        self._collection = collection
+
+    def similarity_search_with_score(self, query, k=4):
+        results = self._collection.query(
+            query_embeddings=[self.embeddings.embed_query(query)],
+            n_results=k,
+            include=["documents", "metadatas", "distances"]
+        )
+        return [
+            (Document(page_content=document, metadata=metadata or {}, id=doc_id), distance)
+            for doc_id, document, metadata, distance in zip(
+                results["ids"][0], results["documents"][0], results["metadatas"][0], results["distances"][0]
+            )
+        ]
+
+    def get(self, ids, include=("metadatas", "documents")):
+        return self._collection.get(ids=ids, include=include)
+
+
+class ShardedVectorStore(CollectionVectorStore):
+    """
+    Vector store backed by the sharded index built by build_sharded_index.
+    """
+
+    def __init__(self, shards_dir, embeddings, max_workers=SHARD_WORKERS):
+        super().__init__(ShardedCollection(shards_dir, max_workers), embeddings)
+
+
+def main():
+    try:
+        # Setup paths
+        current_dir = os.path.dirname(os.path.abspath(__file__))
+        dataset_dir = os.path.join(os.path.dirname(current_dir), "datasets")
+        shards_dir = os.path.join(os.path.dirname(current_dir), "database", "shards")
+
+        df = load_parquet_files(dataset_dir)
+        if DEDUP_ENABLED:
+            df = deduplicate_recipes(df)
+        build_sharded_index(df, shards_dir)
+
+    except Exception as e:
+        logging.error(f"An error occurred: {str(e)}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
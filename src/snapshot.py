@@ -0,0 +1,280 @@
+import os
+import json
+import hashlib
+import logging
+import argparse
+from functools import lru_cache
+import numpy as np
+import pandas as pd
+import chromadb
+from tqdm import tqdm
+
+from shards import COLLECTION_NAME, CollectionVectorStore
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_SEGMENT_SIZE = int(os.environ.get("SNAPSHOT_SEGMENT_SIZE", "50000"))
+SNAPSHOT_IMPORT_BATCH_SIZE = int(os.environ.get("SNAPSHOT_IMPORT_BATCH_SIZE", "5000"))
+# Exact search scans every embedding per query, larger snapshots have to be imported into chroma
+SNAPSHOT_SERVE_MAX_DOCUMENTS = int(os.environ.get("SNAPSHOT_SERVE_MAX_DOCUMENTS", "200000"))
+# Parquet segment columns kept in memory while serving a snapshot
+SNAPSHOT_SEGMENT_CACHE = int(os.environ.get("SNAPSHOT_SEGMENT_CACHE", "8"))
+MANIFEST_FILE = "manifest.json"
+
+
+def file_sha256(path):
+    #Checksum of a snapshot file, read in chunks so large segments don't need to fit in memory
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_snapshot(db_path, snapshot_dir, segment_size=SNAPSHOT_SEGMENT_SIZE):
+    #Write ids, embeddings, documents and metadata of the collection into checksummed segments
+    os.makedirs(snapshot_dir, exist_ok=True)
+    collection = chromadb.PersistentClient(path=db_path).get_collection(COLLECTION_NAME)
+    total = collection.count()
+    logging.info(f"Exporting {total} documents to {snapshot_dir}")
+
+    segments = []
+    dimension = None
+    for index, offset in enumerate(tqdm(range(0, total, segment_size), desc="Exporting segments")):
+        data = collection.get(limit=segment_size, offset=offset,
+                              include=["embeddings", "documents", "metadatas"])
+        embeddings = np.asarray(data["embeddings"], dtype=np.float32)
+        dimension = embeddings.shape[1]
+
+        embeddings_file = f"segment_{index:05d}.embeddings.npy"
+        documents_file = f"segment_{index:05d}.documents.parquet"
+        np.save(os.path.join(snapshot_dir, embeddings_file), embeddings)
+        pd.DataFrame({
+            "id": data["ids"],
+            "document": data["documents"],
+            "metadata": [json.dumps(metadata or {}) for metadata in data["metadatas"]]
+        }).to_parquet(os.path.join(snapshot_dir, documents_file), index=False)
+
+        segments.append({
+            "rows": len(data["ids"]),
+            "embeddings": embeddings_file,
+            "documents": documents_file,
+            "sha256": {
+                embeddings_file: file_sha256(os.path.join(snapshot_dir, embeddings_file)),
+                documents_file: file_sha256(os.path.join(snapshot_dir, documents_file))
+            }
+        })
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "collection": COLLECTION_NAME,
+        "collection_metadata": collection.metadata,
+        "embedding_model": "mxbai-embed-large",
+        "dimension": dimension,
+        "count": sum(segment["rows"] for segment in segments),
+        "segments": segments
+    }
+    # The manifest is written last, so an interrupted export is never mistaken for a complete one
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    logging.info(f"Snapshot with {manifest['count']} documents in {len(segments)} segments written")
+    return manifest
+
+
+def load_manifest(snapshot_dir, verify=True):
+    #Read the manifest and optionally check every segment against its checksum
+    with open(os.path.join(snapshot_dir, MANIFEST_FILE), 'r') as f:
+        manifest = json.load(f)
+
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version {manifest.get('format_version')}")
+
+    if verify:
+        for segment in manifest["segments"]:
+            for name, checksum in segment["sha256"].items():
+                if file_sha256(os.path.join(snapshot_dir, name)) != checksum:
+                    raise ValueError(f"Checksum mismatch for snapshot file {name}")
+    return manifest
+
+
+def import_snapshot(snapshot_dir, db_path, batch_size=SNAPSHOT_IMPORT_BATCH_SIZE):
+    #Restore a ready to serve chroma collection from a snapshot without re-embedding anything
+    manifest = load_manifest(snapshot_dir)
+    os.makedirs(db_path, exist_ok=True)
+    client = chromadb.PersistentClient(path=db_path)
+    collection = client.get_or_create_collection(
+        manifest["collection"],
+        metadata=manifest.get("collection_metadata") or None
+    )
+
+    for segment in tqdm(manifest["segments"], desc="Importing segments"):
+        embeddings = np.load(os.path.join(snapshot_dir, segment["embeddings"]), mmap_mode="r")
+        documents = pd.read_parquet(os.path.join(snapshot_dir, segment["documents"]))
+        for start in range(0, len(documents), batch_size):
+            batch = documents.iloc[start:start + batch_size]
+            collection.upsert(
+                ids=batch["id"].tolist(),
+                embeddings=np.asarray(embeddings[start:start + batch_size]),
+                documents=batch["document"].tolist(),
+                metadatas=[json.loads(metadata) or None for metadata in batch["metadata"]]
+            )
+
+    logging.info(f"Imported {collection.count()} documents into {db_path}")
+
+
+class SnapshotCollection:
+    """
+    Serves a snapshot directly from its memory-mapped embedding segments, with the
+    query/get interface of a chroma collection.
+
+    Every query is an exact scan over all embeddings, so serving is limited to snapshots
+    of up to SNAPSHOT_SERVE_MAX_DOCUMENTS recipes; larger snapshots have to be imported.
+    Documents and metadata stay in the parquet segments and are read when a result needs them.
+    """
+
+    def __init__(self, snapshot_dir, max_documents=SNAPSHOT_SERVE_MAX_DOCUMENTS):
+        manifest = load_manifest(snapshot_dir, verify=False)
+        if manifest["count"] > max_documents:
+            raise ValueError(
+                f"Snapshot has {manifest['count']} documents, exact search is limited to {max_documents}; "
+                f"import it with 'python src/snapshot.py import' instead"
+            )
+
+        # Same distance functions as the chroma collection the snapshot was exported from
+        self.space = (manifest.get("collection_metadata") or {}).get("hnsw:space", "l2")
+        if self.space not in ("l2", "cosine", "ip"):
+            raise ValueError(f"Unsupported distance function {self.space}")
+
+        self.snapshot_dir = snapshot_dir
+        self.segments = manifest["segments"]
+        self.embeddings = []
+        self.norms = []
+        ids = []
+        for segment in self.segments:
+            embeddings = np.load(os.path.join(snapshot_dir, segment["embeddings"]), mmap_mode="r")
+            self.embeddings.append(embeddings)
+            norms = np.einsum("ij,ij->i", embeddings, embeddings)
+            self.norms.append(norms if self.space == "l2" else np.sqrt(norms))
+            # Only the ids are kept in memory
+            ids.extend(pd.read_parquet(os.path.join(snapshot_dir, segment["documents"]), columns=["id"])["id"])
+
+        self.ids = ids
+        self._offsets = np.cumsum([0] + [len(embeddings) for embeddings in self.embeddings])
+        self._positions = {doc_id: position for position, doc_id in enumerate(ids)}
+        self._segment_columns = lru_cache(maxsize=SNAPSHOT_SEGMENT_CACHE)(self._read_segment_column)
+        logging.info(f"Memory-mapped snapshot with {len(ids)} documents ({self.space} distance)")
+
+    def _read_segment_column(self, segment, column):
+        path = os.path.join(self.snapshot_dir, self.segments[segment]["documents"])
+        return pd.read_parquet(path, columns=[column])[column].tolist()
+
+    def _locate(self, position):
+        segment = int(np.searchsorted(self._offsets, position, side="right")) - 1
+        return segment, position - int(self._offsets[segment])
+
+    def _fields(self, position, include):
+        segment, offset = self._locate(position)
+        fields = {}
+        if "documents" in include:
+            fields["documents"] = self._segment_columns(segment, "document")[offset]
+        if "metadatas" in include:
+            fields["metadatas"] = json.loads(self._segment_columns(segment, "metadata")[offset]) or None
+        if "embeddings" in include:
+            fields["embeddings"] = np.asarray(self.embeddings[segment][offset])
+        return fields
+
+    def _distances(self, query):
+        # One segment at a time, so only one segment's scores are materialized besides the result
+        distances = []
+        for embeddings, norms in zip(self.embeddings, self.norms):
+            dots = embeddings @ query
+            if self.space == "l2":
+                # ||e - q||^2 = ||e||^2 - 2 e.q + ||q||^2
+                distances.append(norms - 2 * dots + query @ query)
+            elif self.space == "cosine":
+                distances.append(1 - dots / np.maximum(norms * np.linalg.norm(query), 1e-12))
+            else:
+                distances.append(1 - dots)
+        return np.concatenate(distances) if distances else np.array([], dtype=np.float32)
+
+    def query(self, query_embeddings, n_results=10, include=("metadatas", "documents", "distances")):
+        results = {"ids": []}
+        for key in include:
+            results[key] = []
+
+        for query_embedding in query_embeddings:
+            distances = self._distances(np.asarray(query_embedding, dtype=np.float32))
+            k = min(n_results, len(distances))
+            top = np.argpartition(distances, k - 1)[:k] if k else np.array([], dtype=np.int64)
+            top = top[np.argsort(distances[top])]
+
+            fields = [self._fields(int(position), include) for position in top]
+            results["ids"].append([self.ids[position] for position in top])
+            for key in include:
+                if key == "distances":
+                    results[key].append([float(distances[position]) for position in top])
+                else:
+                    results[key].append([field[key] for field in fields])
+        return results
+
+    def get(self, ids, include=("metadatas", "documents")):
+        results = {"ids": []}
+        for key in include:
+            results[key] = []
+        for doc_id in ids:
+            position = self._positions.get(doc_id)
+            if position is None:
+                continue
+            results["ids"].append(doc_id)
+            fields = self._fields(position, include)
+            for key in include:
+                results[key].append(fields[key])
+        return results
+
+
+class SnapshotVectorStore(CollectionVectorStore):
+    """
+    Vector store served straight from a memory-mapped snapshot, no import needed.
+    """
+
+    def __init__(self, snapshot_dir, embeddings):
+        super().__init__(SnapshotCollection(snapshot_dir), embeddings)
+
+
+def main():
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    db_path = os.path.join(os.path.dirname(current_dir), "database", "chroma_db")
+    default_snapshot = os.path.join(os.path.dirname(current_dir), "database", "snapshot")
+
+    parser = argparse.ArgumentParser(description="Export or import a portable snapshot of the recipe index.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = subparsers.add_parser("export", help="Write the chroma collection to a snapshot")
+    export_parser.add_argument("--snapshot", default=default_snapshot)
+    export_parser.add_argument("--db", default=db_path)
+    export_parser.add_argument("--segment-size", type=int, default=SNAPSHOT_SEGMENT_SIZE)
+
+    import_parser = subparsers.add_parser("import", help="Restore a chroma collection from a snapshot")
+    import_parser.add_argument("--snapshot", default=default_snapshot)
+    import_parser.add_argument("--db", default=db_path)
+    import_parser.add_argument("--batch-size", type=int, default=SNAPSHOT_IMPORT_BATCH_SIZE)
+
+    args = parser.parse_args()
+    try:
+        if args.command == "export":
+            export_snapshot(args.db, args.snapshot, args.segment_size)
+        else:
+            import_snapshot(args.snapshot, args.db, args.batch_size)
+    except Exception as e:
+        logging.error(f"An error occurred: {str(e)}")
+        raise
+
+
+if __name__ == "__main__":
+    main()
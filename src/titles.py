@@ -0,0 +1,196 @@
+import os
+import re
+import math
+import json
+import zlib
+import bisect
+import logging
+import numpy as np
+
+TITLE_SUGGESTION_LIMIT = 8
+# Fuzzy matches need at least this trigram Jaccard similarity with the query
+TITLE_FUZZY_MIN_SIMILARITY = float(os.environ.get("TITLE_FUZZY_MIN_SIMILARITY", "0.3"))
+
+
+def title_of(recipe_text):
+    #The recipe title is the first non-empty line of the recipe text
+    for line in recipe_text.splitlines():
+        if line.strip():
+            return line.strip()
+    return ""
+
+
+def normalize_title(text):
+    #Lowercase and collapse punctuation and whitespace so "Mac & Cheese!" matches "mac cheese"
+    return " ".join(re.findall(r"\w+", text.lower()))
+
+
+def title_trigrams(key):
+    #Hashed character trigrams of a normalized title, padded so word starts count
+    padded = f"  {key} "
+    return {zlib.crc32(padded[i:i + 3].encode("utf-8")) for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """
+    In-memory prefix and trigram index over recipe titles for typeahead suggestions.
+
+    Prefix matches come from a sorted list of normalized titles and are ranked by how many
+    recipes share the title; if there are not enough of them, fuzzy matches from the
+    trigram index fill up the list.
+    """
+
+    def __init__(self, titles, ids):
+        # Titles that occur several times are merged, the count ranks popular titles first
+        merged = {}
+        for title, doc_id in zip(titles, ids):
+            key = normalize_title(title)
+            if not key:
+                continue
+            entry = merged.setdefault(key, [title, []])
+            entry[1].append(str(doc_id))
+
+        self.keys = sorted(merged)
+        self.titles = [merged[key][0] for key in self.keys]
+        self.ids = [merged[key][1] for key in self.keys]
+        self.counts = np.asarray([len(doc_ids) for doc_ids in self.ids], dtype=np.int32)
+
+        # Postings as two parallel arrays sorted by trigram hash, searched with searchsorted
+        codes = []
+        positions = []
+        trigram_counts = []
+        for position, key in enumerate(self.keys):
+            trigrams = title_trigrams(key)
+            codes.extend(trigrams)
+            positions.extend([position] * len(trigrams))
+            trigram_counts.append(len(trigrams))
+        codes = np.asarray(codes, dtype=np.int64)
+        order = np.argsort(codes, kind="stable")
+        self.trigram_codes = codes[order]
+        self.trigram_positions = np.asarray(positions, dtype=np.int32)[order]
+        self.trigram_counts = np.asarray(trigram_counts, dtype=np.int32)
+
+        logging.info(f"Title index with {len(self.keys)} distinct titles built")
+
+    @classmethod
+    def from_dataframe(cls, df):
+        return cls([title_of(text) for text in df["input"].fillna("")], [str(idx) for idx in df.index])
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({"titles": self.titles, "ids": self.ids}, f)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'r') as f:
+            data = json.load(f)
+        titles = [title for title, doc_ids in zip(data["titles"], data["ids"]) for _ in doc_ids]
+        ids = [doc_id for doc_ids in data["ids"] for doc_id in doc_ids]
+        return cls(titles, ids)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def lookup(self, query):
+        """
+        Return the ids of the recipes whose title exactly matches the query.
+
+        Args:
+            query (str): The user query
+
+        Returns:
+            list: The matching ids, empty if no title matches
+        """
+        key = normalize_title(query)
+        position = bisect.bisect_left(self.keys, key)
+        if key and position < len(self.keys) and self.keys[position] == key:
+            return self.ids[position]
+        return []
+
+    def complete(self, query, limit=TITLE_SUGGESTION_LIMIT):
+        """
+        Return ranked title completions for a partially typed query.
+
+        Args:
+            query (str): What the user typed so far
+            limit (int): Maximum number of suggestions
+
+        Returns:
+            list: Suggested titles, best first
+        """
+        key = normalize_title(query)
+        if not key:
+            return []
+
+        # Prefix matches, the most common titles first
+        low = bisect.bisect_left(self.keys, key)
+        high = bisect.bisect_left(self.keys, key + "\uffff")
+        matches = []
+        if high > low:
+            counts = self.counts[low:high]
+            best = np.argsort(-counts, kind="stable")[:limit]
+            matches = [low + int(i) for i in best]
+
+        if len(matches) < limit and len(key) >= 3:
+            seen = set(matches)
+            for position in self._fuzzy_matches(key, limit * 2):
+                if position not in seen:
+                    matches.append(position)
+                    seen.add(position)
+                if len(matches) >= limit:
+                    break
+
+        return [self.titles[position] for position in matches[:limit]]
+
+    def _fuzzy_matches(self, key, limit):
+        # Rank titles by trigram Jaccard similarity with the query, titles below the floor are dropped
+        query_trigrams = title_trigrams(key)
+        postings = []
+        for code in query_trigrams:
+            start, end = np.searchsorted(self.trigram_codes, [code, code + 1])
+            if end > start:
+                postings.append(self.trigram_positions[start:end])
+
+        # A title above the floor shares at least min_shared trigrams with the query
+        min_shared = max(1, math.ceil(TITLE_FUZZY_MIN_SIMILARITY * len(query_trigrams)))
+        if len(postings) < min_shared:
+            return []
+        # Counting shared trigrams per title is linear in the postings, no sorting needed
+        shared = np.bincount(np.concatenate(postings, dtype=np.intp), minlength=len(self.keys))
+        candidates = np.flatnonzero(shared >= min_shared)
+        shared = shared[candidates]
+        counts = self.trigram_counts[candidates]
+
+        scores = shared / (len(query_trigrams) + counts - shared)
+        keep = scores >= TITLE_FUZZY_MIN_SIMILARITY
+        candidates, scores = candidates[keep], scores[keep]
+        if len(candidates) > limit:
+            top = np.argpartition(-scores, limit - 1)[:limit]
+            candidates, scores = candidates[top], scores[top]
+        best = np.lexsort((candidates, -scores))
+        return [int(candidates[i]) for i in best]
+
+
+def load_title_index(index_path, dataset_dir=None):
+    """
+    Load the title index written by vector.py, or build it from the parquet files.
+
+    Args:
+        index_path (str): Path to the saved title index
+        dataset_dir (str): Directory with the parquet files, used if the index was not saved
+
+    Returns:
+        TitleIndex: The index, or None if neither source is available
+    """
+    try:
+        if os.path.exists(index_path):
+            return TitleIndex.load(index_path)
+        if dataset_dir and os.path.isdir(dataset_dir):
+            from vector import load_parquet_files
+            return TitleIndex.from_dataframe(load_parquet_files(dataset_dir))
+    except Exception as e:
+        logging.error(f"Error loading title index: {str(e)}")
+        return None
+
+    logging.info("No title index or dataset found, typeahead suggestions are disabled")
+    return None
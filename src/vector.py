@@ -1,4 +1,6 @@
 import os
+import re
+import zlib
 import logging
 import pandas as pd
 from langchain_ollama import OllamaEmbeddings
@@ -8,6 +10,8 @@ from tqdm import tqdm
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import numpy as np
 import json
+from docstore import build_document_store
+from titles import TitleIndex
 
 # Configure logging
 logging.basicConfig(
@@ -15,6 +19,18 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s'
 )
 
+# Near-duplicate detection: MinHash over word shingles, LSH with DEDUP_BANDS bands of NUM_PERM / BANDS rows
+DEDUP_ENABLED = os.environ.get("DEDUP_RECIPES", "1") == "1"
+DEDUP_SHINGLE_SIZE = 3
+DEDUP_NUM_PERM = int(os.environ.get("DEDUP_NUM_PERM", "64"))
+DEDUP_BANDS = int(os.environ.get("DEDUP_BANDS", "16"))
+DEDUP_JACCARD = float(os.environ.get("DEDUP_JACCARD", "0.8"))
+# Optional second pass: candidates with a lower Jaccard estimate are merged if their embeddings are this close
+DEDUP_COSINE = float(os.environ.get("DEDUP_COSINE", "0"))
+DEDUP_COSINE_MIN_JACCARD = 0.5
+DEDUP_EMBED_BATCH_SIZE = int(os.environ.get("DEDUP_EMBED_BATCH_SIZE", "500"))
+MINHASH_PRIME = (1 << 61) - 1
+
 def load_parquet_files(dataset_dir):
     #Load and combine parquet files from the dataset directory
     logging.info(f"Loading parquet files from {dataset_dir}")
@@ -41,6 +57,96 @@ def load_parquet_files(dataset_dir):
     logging.info(f"Combined dataset size: {len(combined_df)} rows")
     return combined_df
 
+def minhash_signature(text, coefficients):
+    #MinHash signature of the word shingles of a text, None if the text has no words to shingle
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    shingles = {" ".join(words[i:i + DEDUP_SHINGLE_SIZE]) for i in range(max(1, len(words) - DEDUP_SHINGLE_SIZE + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    a, b = coefficients
+    return ((a[:, None] * hashes[None, :] + b[:, None]) % MINHASH_PRIME).min(axis=1)
+
+def find_candidate_pairs(signatures, bands):
+    #Pairs of rows that share at least one LSH band
+    rows_per_band = signatures.shape[1] // bands
+    pairs = set()
+    for band in range(bands):
+        buckets = {}
+        band_values = signatures[:, band * rows_per_band:(band + 1) * rows_per_band]
+        for row, key in enumerate(map(bytes, band_values)):
+            first = buckets.setdefault(key, row)
+            if first != row:
+                pairs.add((first, row))
+    return pairs
+
+def cosine_similar_pairs(df, pairs, embeddings, threshold):
+    #Keep the candidate pairs whose recipe embeddings are at least threshold cosine similar
+    rows = sorted({row for pair in pairs for row in pair})
+    if not rows:
+        return []
+    logging.info(f"Embedding {len(rows)} candidate recipes for cosine deduplication")
+    texts = df["input"].iloc[rows].tolist()
+    vectors = []
+    for start in tqdm(range(0, len(texts), DEDUP_EMBED_BATCH_SIZE), desc="Embedding candidates"):
+        vectors.extend(embeddings.embed_documents(texts[start:start + DEDUP_EMBED_BATCH_SIZE]))
+    vectors = np.asarray(vectors, dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True) + 1e-12
+    position = {row: i for i, row in enumerate(rows)}
+    return [(a, b) for a, b in pairs if float(vectors[position[a]] @ vectors[position[b]]) >= threshold]
+
+def deduplicate_recipes(df, embeddings=None):
+    #Collapse near-duplicate recipes to the first occurrence and record the others as its aliases
+    logging.info("Detecting near-duplicate recipes...")
+    rng = np.random.default_rng(42)
+    coefficients = (
+        rng.integers(1, 1 << 31, DEDUP_NUM_PERM, dtype=np.uint64),
+        rng.integers(0, 1 << 31, DEDUP_NUM_PERM, dtype=np.uint64)
+    )
+    texts = df["input"].fillna("").tolist()
+    signatures = [minhash_signature(text, coefficients) for text in tqdm(texts, desc="MinHash")]
+    # Rows without shingles would all get the same signature, they are never merged
+    rows = [row for row, signature in enumerate(signatures) if signature is not None]
+    signatures = np.stack([signatures[row] for row in rows]) if rows \
+        else np.empty((0, DEDUP_NUM_PERM), dtype=np.uint64)
+
+    # Union-find over the row positions
+    parent = list(range(len(df)))
+    def find(row):
+        while parent[row] != row:
+            parent[row] = parent[parent[row]]
+            row = parent[row]
+        return row
+    def union(a, b):
+        a, b = find(a), find(b)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+
+    loose_pairs = []
+    for i, j in find_candidate_pairs(signatures, DEDUP_BANDS):
+        jaccard = float(np.mean(signatures[i] == signatures[j]))
+        if jaccard >= DEDUP_JACCARD:
+            union(rows[i], rows[j])
+        elif jaccard >= DEDUP_COSINE_MIN_JACCARD:
+            loose_pairs.append((rows[i], rows[j]))
+
+    if DEDUP_COSINE > 0 and embeddings is not None:
+        for a, b in cosine_similar_pairs(df, loose_pairs, embeddings, DEDUP_COSINE):
+            union(a, b)
+
+    aliases = {}
+    for row in range(len(df)):
+        root = find(row)
+        if root != row:
+            aliases.setdefault(root, []).append(str(df.index[row]))
+
+    canonical = [row for row in range(len(df)) if find(row) == row]
+    deduped = df.iloc[canonical].copy()
+    deduped["aliases"] = [",".join(aliases.get(row, [])) for row in canonical]
+
+    logging.info(f"Removed {len(df) - len(deduped)} near-duplicate recipes, {len(deduped)} remain")
+    return deduped
+
 def create_documents_batch(batch_df):
     #Create documents from a batch of dataframe rows
     documents = []
@@ -48,9 +154,13 @@ def create_documents_batch(batch_df):
     for idx, row in batch_df.iterrows():
         try:
             recipe_text = row["input"]
+            metadata = {"id": str(idx)}
+            if row.get("aliases"):
+                # Ids of the near-duplicates collapsed into this recipe
+                metadata["aliases"] = row["aliases"]
             doc = Document(
                 page_content=recipe_text,
-                metadata={"id": str(idx)},
+                metadata=metadata,
                 id=str(idx)
             )
             documents.append(doc)
@@ -134,6 +244,12 @@ def create_vector_store(df, db_path):
     logging.info("Vector store creation completed")
     return vector_store
 
+def create_document_store(df, store_path):
+    #Write the recipe texts into the memory-mapped document store used for previews
+    logging.info("Building document store...")
+    compress = os.environ.get("DOCSTORE_COMPRESS", "0") == "1"
+    build_document_store(store_path, [str(idx) for idx in df.index], df["input"].tolist(), compress=compress)
+
 def main():
     try:
         # Setup paths
@@ -147,6 +263,16 @@ def main():
         # Load data
         df = load_parquet_files(dataset_dir)
         
+        # Collapse near-duplicate recipes
+        if DEDUP_ENABLED:
+            df = deduplicate_recipes(df, OllamaEmbeddings(model="mxbai-embed-large"))
+        
+        # Create document store
+        create_document_store(df, os.path.join(os.path.dirname(db_path), "docstore"))
+        
+        # Create title index for typeahead suggestions
+        TitleIndex.from_dataframe(df).save(os.path.join(os.path.dirname(db_path), "titles.json"))
+        
         # Create vector store
         vector_store = create_vector_store(df, db_path)
         
@@ -1,14 +1,32 @@
 import os
+import json
 import logging
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, Response, render_template, request, jsonify, stream_with_context
 
 from search import (
+    MULTI_DOC_RESULTS,
     load_models_and_db,
     enhance_query,
     query_chroma_db,
     generate_content_summary,
-    suggest_next_queries
+    suggest_next_queries,
+    summarize_documents_parallel,
+    stream_comparative_answer,
+    embed_query,
+    fetch_document_embeddings,
+    split_recipe_sections,
+    build_bounded_context,
+    answer_follow_up,
+    load_enrichment,
+    needs_refinement,
+    refine_precomputed_summary,
+    format_preview,
+    speculative_search,
+    speculation_stats
 )
+from session import SessionStore
+from docstore import load_document_store
+from titles import load_title_index
 
 # Configure logging
 logging.basicConfig(
@@ -21,6 +39,16 @@ app = Flask(__name__)
 # Global variables to store models and database
 vector_store = None
 llm = None
+docstore = None
+title_index = None
+session_store = SessionStore()
+enrichment = {}
+
+# Serve precomputed summaries and suggestions when enrich.py has been run
+SERVE_PRECOMPUTED = os.environ.get("SERVE_PRECOMPUTED", "1") == "1"
+
+# Retrieve with the raw query while the query enhancement is still running
+SPECULATIVE_RETRIEVAL = os.environ.get("SPECULATIVE_RETRIEVAL", "1") == "1"
 
 
 @app.route('/')
@@ -38,24 +66,75 @@ def chat():
 
         user_query = data.get('query', '').strip()
         raw_mode = data.get('raw_mode', False)
+        multi_doc = data.get('multi_doc', False) and not raw_mode
+        precomputed = data.get('precomputed', SERVE_PRECOMPUTED) and bool(enrichment) \
+            and not raw_mode and not multi_doc
+        # Exact recipe titles (e.g. picked from the typeahead) don't need query enhancement
+        exact_title = title_index is not None and bool(title_index.lookup(user_query))
+        speculative = data.get('speculative', SPECULATIVE_RETRIEVAL) \
+            and not raw_mode and not multi_doc and not precomputed and not exact_title
 
         if not user_query:
             return jsonify({'error': 'Please enter a valid query.'}), 400
 
-        if not raw_mode:
-            enhanced_query = enhance_query(llm, user_query)
+        session = session_store.get_or_create(data.get('session_id'))
+
+        # Embedded once per request, reused for follow-up detection, retrieval and content scoring
+        query_embedding = embed_query(vector_store, user_query)
+
+        if not raw_mode and not multi_doc and not exact_title and session.documents:
+            # Follow-ups about an earlier result skip retrieval and summarization; a picked title
+            # always retrieves that recipe, even if it resembles one discussed earlier
+            with session.lock:
+                document = session.find_follow_up_document(user_query, query_embedding)
+                if document is not None:
+                    answer = answer_follow_up(llm, document, user_query, vector_store.embeddings,
+                                              query_embedding)
+                    return jsonify({
+                        'response': f"**About:** {split_recipe_sections(document['content'])[0]}\n\n{answer}",
+                        'suggestions': document.get('suggestions', []),
+                        'session_id': session.session_id
+                    })
+
+        speculated = None
+        if speculative:
+            results, speculated = speculative_search(llm, vector_store, user_query, docstore, query_embedding)
         else:
-            enhanced_query = user_query
+            if not raw_mode and not precomputed and not exact_title:
+                enhanced_query = enhance_query(llm, user_query)
+            else:
+                enhanced_query = user_query
 
-        results = query_chroma_db(vector_store, enhanced_query, num_results=1)
+            num_results = MULTI_DOC_RESULTS if multi_doc else 1
+            results = query_chroma_db(vector_store, enhanced_query, num_results=num_results, docstore=docstore,
+                                      query_embedding=query_embedding if enhanced_query == user_query else None)
 
         if not results:
             return jsonify({
                 'response': 'No matching results found.',
-                'suggestions': []
+                'suggestions': [],
+                'session_id': session.session_id
             })
 
+        if multi_doc:
+            return Response(
+                stream_with_context(stream_multi_doc_answer(results, user_query, query_embedding)),
+                mimetype='application/x-ndjson'
+            )
+
         result = results[0]
+        doc_id = result["metadata"].get("id")
+
+        if precomputed and doc_id in enrichment:
+            response, content_summary = format_precomputed_response(result, enrichment[doc_id], user_query,
+                                                                   query_embedding)
+            suggestions = enrichment[doc_id]['suggestions']
+            remember_result(session, doc_id, result, content_summary, suggestions)
+            return jsonify({
+                'response': response,
+                'suggestions': suggestions,
+                'session_id': session.session_id
+            })
 
         if raw_mode:
             # Simple response for raw mode
@@ -68,10 +147,22 @@ def chat():
 **Metadata:** {result['metadata']}"""
             suggestions = []
         else:
-            content_summary = generate_content_summary(llm, result["content"], user_query)
-            content_preview = result["content"]
-            if len(content_preview) > 500:
-                content_preview = content_preview[:500] + "..."
+            with session.lock:
+                cached = session.get_document(doc_id) if doc_id is not None else None
+
+            content = result["content"]
+            if speculated is None and not (cached is not None and "summary" in cached and "suggestions" in cached):
+                # Bound the recipe once, the summary and the suggestions prompt share the excerpt
+                content = build_bounded_context(content, user_query, vector_store.embeddings, query_embedding)
+
+            if speculated is not None:
+                content_summary = speculated["summary"]
+            elif cached is not None and "summary" in cached:
+                # Already summarized earlier in this conversation
+                content_summary = cached["summary"]
+            else:
+                content_summary = generate_content_summary(llm, content, user_query)
+            content_preview = format_preview(result)
 
             response = f"""**Summary:**
 {content_summary}
@@ -82,12 +173,20 @@ def chat():
 {content_preview}
 
 **Metadata:** {result['metadata']}"""
-            # Generate suggestions using your existing function
-            suggestions = suggest_next_queries(llm, result["content"], user_query)
+            if speculated is not None:
+                suggestions = speculated["suggestions"]
+            elif cached is not None and "suggestions" in cached:
+                suggestions = cached["suggestions"]
+            else:
+                # Generate suggestions using your existing function
+                suggestions = suggest_next_queries(llm, content, user_query)
+
+            remember_result(session, doc_id, result, content_summary, suggestions, cached)
 
         return jsonify({
             'response': response,
-            'suggestions': suggestions
+            'suggestions': suggestions,
+            'session_id': session.session_id
         })
 
     except Exception as e:
@@ -95,6 +194,93 @@ def chat():
         return jsonify({'error': 'An error occurred while processing your request.'}), 500
 
 
+def remember_result(session, doc_id, result, content_summary, suggestions, cached=None):
+    """Record a served result in the session so follow-up questions can reuse it."""
+    if doc_id is None:
+        return
+    embedding = cached.get("embedding") if cached is not None else None
+    if embedding is None:
+        embedding = fetch_document_embeddings(vector_store, [doc_id]).get(doc_id)
+    with session.lock:
+        session.remember_document(doc_id, result, embedding, content_summary, suggestions)
+        session.last_suggestions = suggestions
+
+
+def format_precomputed_response(result, record, user_query, query_embedding=None):
+    """
+    Build the chat response from the precomputed enrichment of a recipe.
+
+    The LLM is only called when the query asks for something the precomputed summary
+    doesn't cover. Returns the response text and the summary that was served.
+    """
+    content_preview = format_preview(result)
+
+    content_summary = record['summary']
+    # The title is at the start of the preview, the full text is only read when refining
+    if needs_refinement(record, content_preview, user_query):
+        content_summary = refine_precomputed_summary(llm, record, result["content"], user_query,
+                                                     vector_store.embeddings, query_embedding)
+
+    response = f"""**Summary:**
+{content_summary}
+
+**Tags:** {', '.join(record['tags'])}
+
+**Relevance Score:** {result['similarity_score']:.4f}
+
+**Content Preview:**
+{content_preview}
+
+**Metadata:** {result['metadata']}"""
+    return response, content_summary
+
+
+def stream_multi_doc_answer(results, user_query, query_embedding=None):
+    """
+    Stream a comparative answer over several recipes as newline-delimited JSON.
+
+    The first line lists the compared recipes, followed by one line per answer chunk
+    and a final line marking the end of the stream.
+    """
+    try:
+        summaries = summarize_documents_parallel(llm, results, user_query, vector_store.embeddings,
+                                                 query_embedding=query_embedding)
+        sources = [
+            {'title': item['title'], 'similarity_score': item['similarity_score']}
+            for item in summaries
+        ]
+        yield json.dumps({'type': 'sources', 'sources': sources}) + '\n'
+
+        for chunk in stream_comparative_answer(llm, summaries, user_query):
+            yield json.dumps({'type': 'chunk', 'text': chunk}) + '\n'
+    except Exception as e:
+        logging.error(f"Error streaming multi document answer: {str(e)}")
+        yield json.dumps({'type': 'error', 'error': 'An error occurred while processing your request.'}) + '\n'
+
+    yield json.dumps({'type': 'done'}) + '\n'
+
+
+@app.route('/suggest')
+def suggest():
+    query = request.args.get('q', '').strip()
+    if title_index is None or not query:
+        return jsonify({'suggestions': []})
+    return jsonify({'suggestions': title_index.complete(query)})
+
+
+@app.route('/session', methods=['DELETE'])
+def end_session():
+    data = request.get_json(silent=True) or {}
+    if data.get('session_id'):
+        session_store.discard(data['session_id'])
+    return jsonify({'status': 'ok'})
+
+
+@app.route('/stats')
+def stats():
+    return jsonify({'speculation': speculation_stats.as_dict()})
+
+
 @app.route('/health')
 def health():
     return jsonify({'status': 'healthy'})
@@ -111,13 +297,20 @@ def internal_error(error):
 
 
 def initialize_app():
-    global vector_store, llm
+    global vector_store, llm, enrichment, docstore, title_index
 
     current_dir = os.path.dirname(os.path.abspath(__file__))
     db_path = os.path.join(os.path.dirname(current_dir), "database", "chroma_db")
 
     try:
-        vector_store, llm = load_models_and_db(db_path)
+        # Concurrent requests share embedding calls
+        vector_store, llm = load_models_and_db(db_path, micro_batching=True)
+        docstore = load_document_store(os.path.join(os.path.dirname(db_path), "docstore"))
+        enrichment = load_enrichment(os.path.join(os.path.dirname(db_path), "enrichment.jsonl"))
+        title_index = load_title_index(
+            os.path.join(os.path.dirname(db_path), "titles.json"),
+            os.path.join(os.path.dirname(current_dir), "datasets")
+        )
         logging.info("initialized successfully")
     except Exception as e:
         logging.error(f"Failed : {str(e)}")